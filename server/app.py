@@ -1,13 +1,14 @@
 import base64
 import io
-import json
 import queue
 from PIL import Image
 from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from firebase import process_and_upload, fetch_defects, process_and_upload_reports
-from detect import analyze_location, analyze_report
+from firebase import process_and_upload, fetch_defects, process_and_upload_reports, fetch_reports
+from detect import analyze_location, analyze_location_adaptive, analyze_report
 from street_view import capture_images_in_radius
+from encoding import DefectSnapshot, MIMETYPES, FORMAT_JSON, brotli
+from tiles import TileGrid, MAX_TILE_ZOOM
 
 # Create an app instance
 app = Flask(__name__)
@@ -19,6 +20,34 @@ CORS(app, resources={r"/*": {"origins": "*", "supports_credentials": True}})
 # Queue to store clients subscribed to updates
 clients = []
 
+# Latest defects and their encoded payloads, shared by all requests
+snapshot = DefectSnapshot(lambda: fetch_defects(raise_errors=True))
+
+# Pre-aggregated defect and report counts for zoomed-out map views
+# road_defects comes from the snapshot instead of a second scan
+tile_grid = TileGrid(lambda: snapshot.get() + fetch_reports(raise_errors=True))
+
+def negotiate_format():
+    """
+    Pick the defect feed format from the `format` query param or Accept header
+    """
+    fmt = request.args.get("format")
+    if fmt in MIMETYPES:
+        return fmt
+    formats = {mimetype: name for name, mimetype in MIMETYPES.items()}
+    best = request.accept_mimetypes.best_match(list(formats), default=MIMETYPES[FORMAT_JSON])
+    return formats[best]
+
+def negotiate_encoding():
+    """
+    Pick the content encoding from the Accept-Encoding header
+    """
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
 def notify_clients(data):
     """Notify all clients with new data"""
     for client in clients[:]:
@@ -32,13 +61,46 @@ def notify_clients(data):
 def get_defects():
     """
     Get all road defects from the database
+
+    Query params:
+      format (str, optional): json, columnar or msgpack, overrides the Accept header
     
     Returns:
-        JSON response containing all defect records
+        Response containing all defect records, as plain JSON by default or in
+        the compact columnar layout for columnar/msgpack. Compressed with
+        brotli or gzip if the client accepts it.
     """
     try:
-        defects = fetch_defects()
-        return jsonify(defects)
+        fmt = negotiate_format()
+        content_encoding = negotiate_encoding()
+        response = Response(snapshot.payload(fmt, content_encoding), mimetype=MIMETYPES[fmt])
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+        response.vary.update(["Accept", "Accept-Encoding"])
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/defects/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_tile(z, x, y):
+    """
+    Get aggregated defect counts for a map tile
+
+    Path params:
+      z (int): Zoom level, at most MAX_TILE_ZOOM
+      x (int): Tile column
+      y (int): Tile row
+
+    Returns:
+        JSON response containing the tile totals and per cell counts by
+        class and status
+    """
+    if z > MAX_TILE_ZOOM:
+        return jsonify({"error": f"Zoom level must be at most {MAX_TILE_ZOOM}, use /defects instead"}), 400
+    if x >= (1 << z) or y >= (1 << z):
+        return jsonify({"error": "Tile out of range"}), 400
+    try:
+        return jsonify(tile_grid.tile(z, x, y))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -46,21 +108,31 @@ def get_defects():
 def stream():
     """
     Create SSE stream for real-time updates
+
+    The stream is not compressed, gzip would need a separate compressor per
+    subscriber and the shared per-snapshot cache could no longer be used.
+    Use format=columnar to keep the initial event small, msgpack has to be
+    base64 encoded over SSE which makes it about a third larger than the
+    raw bytes.
+
+    Query params:
+      format (str, optional): json, columnar (recommended) or msgpack (base64 encoded)
     """
+    fmt = negotiate_format()
+
     def generate():
         client_queue = queue.Queue()
         clients.append(client_queue)
         
         try:
             # Send initial data
-            defects = fetch_defects()
-            yield f"data: {json.dumps(defects)}\n\n"
+            yield snapshot.sse_event(fmt)
             
-            # Wait for updates
+            # Wait for updates, the event is encoded once and shared by all clients
             while True:
-                data = client_queue.get()
-                yield f"data: {json.dumps(data)}\n\n"
-        except GeneratorExit:
+                client_queue.get()
+                yield snapshot.sse_event(fmt)
+        finally:
             clients.remove(client_queue)
     
     return Response(generate(), mimetype="text/event-stream")
@@ -75,6 +147,9 @@ def analyze():
       center_lng (float): Longitude of the center point
       radius_km (float): Radius in kilometers
       num_points (int): Number of points to generate
+      adaptive (bool, optional): Probe one heading per point and only expand around defects
+      max_images (int, optional): Image budget for adaptive scans, defaults to num_points * 4
+      min_detections (int, optional): Detections needed to expand around a point, at least 1, defaults to 1
 
     Returns:
       JSON response containing the status of the request
@@ -88,18 +163,35 @@ def analyze():
         radius_km = float(args.get("radius_km"))
         num_points = int(args.get("num_points"))
         
-        print("Collecting images... ", center_lat, center_lng, radius_km, num_points)
-        images = capture_images_in_radius(center_lat, center_lng, radius_km, num_points)
+        adaptive = str(args.get("adaptive", False)).lower() in ("true", "1")
         
-        print("Analyzing images...")
-        original_images, annotated_images, metadata = analyze_location(images, confidence_threshold=0.25)
+        if adaptive:
+            max_images = int(args.get("max_images", num_points * 4))
+            min_detections = int(args.get("min_detections", 1))
+            if max_images < 0 or min_detections < 1:
+                return jsonify({"error": "max_images must be at least 0 and min_detections at least 1"}), 400
+
+            print("Scanning adaptively... ", center_lat, center_lng, radius_km, num_points, max_images)
+            original_images, annotated_images, metadata = analyze_location_adaptive(
+                center_lat, center_lng, radius_km, num_points, max_images,
+                min_detections=min_detections, confidence_threshold=0.25
+            )
+        else:
+            print("Collecting images... ", center_lat, center_lng, radius_km, num_points)
+            images = capture_images_in_radius(center_lat, center_lng, radius_km, num_points)
+            
+            print("Analyzing images...")
+            original_images, annotated_images, metadata = analyze_location(images, confidence_threshold=0.25)
         
         print("Processing and uploading to database...")
         result = process_and_upload(original_images, annotated_images, metadata)
+        if isinstance(result, list):
+            tile_grid.add_records(result)
         
         print("Notifying clients...")
-        defects = fetch_defects()
-        notify_clients(defects)
+        version = snapshot.refresh()
+        if version is not None:
+            notify_clients(version)
         
         # print(result)
         return jsonify(result)
@@ -157,6 +249,8 @@ def report():
 
         # Upload to Firebase
         result = process_and_upload_reports(original_image, annotated_image, metadata)
+        if "error" not in result:
+            tile_grid.add_records([result])
         
 
         return jsonify({
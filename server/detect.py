@@ -1,13 +1,19 @@
 from ultralytics import YOLO
-from street_view import capture_images_in_radius
+from street_view import capture_images_in_radius, generate_panos_in_radius, fetch_street_view_image, get_street_name, distance_km
 from typing import List, Dict, Tuple
 from datetime import datetime
 from PIL import Image
 import cv2
+import heapq
 import json
+import math
 
 model = YOLO("models/new/best.pt")
 
+# Adaptive scan settings
+HEADINGS = [0, 90, 180, 270]
+DENSIFY_POINTS = 2
+
 def detect(imgs, confidence_threshold=0.25) -> List[Dict]:
     """
     Detect road defects from images and return detection results
@@ -81,6 +87,34 @@ def generate_defect_metadata(image_results: List[Dict], detections: List[Dict])
     
     return metadata_list
 
+def _collect_defects(image_results: List[Dict], results, detections: List[List[Dict]]) -> Tuple[List[Image.Image], List[Image.Image], List[Dict]]:
+    """
+    Build the original images, annotated images and metadata for the images with defects
+    
+    Args:
+        image_results: List of dictionaries containing image information and PIL images
+        results: Model results for each image
+        detections: List of detection results for each image
+        
+    Returns:
+        Same tuple as analyze_location
+    """
+    # Generate metadata
+    metadata = generate_defect_metadata(image_results, detections)
+    
+    # Prepare return lists
+    original_images = []
+    annotated_images = []
+    
+    # Filter images with defects and create annotated versions
+    for img_data, result, detection in zip(image_results, results, detections):
+        if detection:  # If defects were found
+            original_images.append(img_data["img"])
+            annotated_img = Image.fromarray(cv2.cvtColor(result.plot(), cv2.COLOR_BGR2RGB))
+            annotated_images.append(annotated_img)
+    
+    return original_images, annotated_images, metadata
+
 def analyze_location(image_results: List[Dict], confidence_threshold: float = 0.25) -> Tuple[List[Image.Image], List[Image.Image], List[Dict]]:
     """
     Analyze street view images and return images with defects, their annotated versions, and metadata.
@@ -101,22 +135,101 @@ def analyze_location(image_results: List[Dict], confidence_threshold: float = 0.
     # Run detection
     results, detections = detect(images, confidence_threshold)
     
-    # Generate metadata
-    metadata = generate_defect_metadata(image_results, detections)
-    
-    # Prepare return lists
-    original_images = []
-    annotated_images = []
-    
-    # Filter images with defects and create annotated versions
-    for idx, (result, detection) in enumerate(zip(results, detections)):
-        if detection:  # If defects were found
-            original_images.append(images[idx])
-            annotated_img = Image.fromarray(cv2.cvtColor(result.plot(), cv2.COLOR_BGR2RGB))
-            annotated_images.append(annotated_img)
-            
+    return _collect_defects(image_results, results, detections)
+
+def analyze_location_adaptive(center_lat: float, center_lng: float, radius_km: float, num_points: int,
+                              max_images: int, min_detections: int = 1,
+                              confidence_threshold: float = 0.25) -> Tuple[List[Image.Image], List[Image.Image], List[Dict]]:
+    """
+    Scan an area adaptively, spending the image budget where defects are found.
+
+    Every point is first probed with a single heading, rotated across points
+    so streets of every orientation get looked along. Points with at least
+    min_detections detections, densest first, then get their three other
+    headings and DENSIFY_POINTS extra nearby points which are probed the same
+    way. Extra points outside radius_km of the center, or snapping to a
+    panorama that was already probed, are skipped so the scan never leaves
+    the requested area or fetches the same frame twice. Street names are
+    only looked up for images with defects.
     
-    return original_images, annotated_images, metadata
+    Args:
+        center_lat: Latitude of the center point
+        center_lng: Longitude of the center point
+        radius_km: Radius in kilometers
+        num_points: Number of points to probe
+        max_images: Maximum number of street view images to fetch
+        min_detections: Detections needed in a frame to expand around its point
+        confidence_threshold: Minimum confidence score for detection
+        
+    Returns:
+        Same tuple as analyze_location
+    """
+    image_results = []
+    results = []
+    detections = []
+    budget = max(max_images, 0)
+
+    # Panorama ids already probed
+    probed = set()
+
+    def scan(requests: List[Tuple[float, float, str, int]]) -> List[int]:
+        """Fetch and detect the requested (lat, lng, pano_id, heading) frames within budget"""
+        nonlocal budget
+        requests = requests[:budget]
+        if not requests:
+            return []
+        batch = [
+            {"lat": lat, "lon": lng, "heading": heading, "img": fetch_street_view_image(lat, lng, heading, pano_id)}
+            for lat, lng, pano_id, heading in requests
+        ]
+        budget -= len(batch)
+        batch_results, batch_detections = detect([item["img"] for item in batch], confidence_threshold)
+        image_results.extend(batch)
+        results.extend(batch_results)
+        detections.extend(batch_detections)
+        return [len(detection) for detection in batch_detections]
+
+    def probe(panos: List[Tuple[float, float, str]], hot: List):
+        """Probe new panoramas inside the scan area with a single heading and queue the dense ones"""
+        requests = []
+        for lat, lng, pano_id in panos:
+            if pano_id in probed or distance_km(center_lat, center_lng, lat, lng) > radius_km:
+                continue
+            heading = HEADINGS[len(probed) % len(HEADINGS)]
+            probed.add(pano_id)
+            requests.append((lat, lng, pano_id, heading))
+
+        counts = scan(requests)
+        for count, request in zip(counts, requests):
+            if count >= min_detections:
+                heapq.heappush(hot, (-count, request))
+
+    # Roughly the spacing between the uniformly sampled points, extra points
+    # are kept at least half of it away so they reach a different panorama
+    dense_radius_km = radius_km / math.sqrt(max(num_points, 1))
+
+    hot = []
+    probe(generate_panos_in_radius(center_lat, center_lng, radius_km, num_points), hot)
+
+    while hot and budget > 0:
+        _, (lat, lng, pano_id, probe_heading) = heapq.heappop(hot)
+        scan([(lat, lng, pano_id, heading) for heading in HEADINGS if heading != probe_heading])
+        if budget > 0:
+            probe(generate_panos_in_radius(lat, lng, dense_radius_km, DENSIFY_POINTS, dense_radius_km / 2), hot)
+
+    print(f"Adaptive scan fetched {len(image_results)} images, "
+          f"{sum(1 for detection in detections if detection)} with defects")
+
+    # Look up street names once per point, only where defects were found
+    street_names = {}
+    for img_data, detection in zip(image_results, detections):
+        if detection:
+            point = (img_data["lat"], img_data["lon"])
+            if point not in street_names:
+                street_names[point] = get_street_name(*point)
+            img_data["street_name"] = street_names[point]
+
+    return _collect_defects(image_results, results, detections)
 
 def generate_report_metadata(detections: List[List[Dict]]) -> Dict:
     """
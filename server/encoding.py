@@ -0,0 +1,265 @@
+import array
+import base64
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import msgpack
+
+# Brotli is optional, gzip is used when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported output formats
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_MSGPACK = "msgpack"
+
+MIMETYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_COLUMNAR: "application/vnd.saferoad.columnar+json",
+    FORMAT_MSGPACK: "application/x-msgpack",
+}
+
+# Bump when the layout produced by to_columnar changes
+COLUMNAR_VERSION = 1
+
+# Quantization factors
+COORD_SCALE = 1_000_000  # degrees -> microdegrees (~0.1 m)
+CONFIDENCE_SCALE = 1000
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# On-the-fly compression levels, brotli's default (11) takes seconds on large payloads
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+EPOCH = datetime(1970, 1, 1)
+
+def _intern(table: List[str], index: Dict[str, int], value: str) -> int:
+    """
+    Return the index of value in the string table, appending it if needed
+    """
+    if value not in index:
+        index[value] = len(table)
+        table.append(value)
+    return index[value]
+
+def _to_seconds(value) -> int:
+    """
+    Convert a naive timestamp (datetime, ISO string or TIMESTAMP_FORMAT string)
+    to whole seconds since 1970-01-01. The wall clock value is kept as is, so
+    clients should decode it as UTC.
+    """
+    if not value:
+        return 0
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value, TIMESTAMP_FORMAT)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    return int((value.replace(tzinfo=None) - EPOCH).total_seconds())
+
+def _typed(values: List[int], typecode: str = 'i') -> bytes:
+    """
+    Pack a list of integers into a little-endian typed array buffer
+    ('i' -> Int32Array, 'I' -> Uint32Array on the client)
+    """
+    arr = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+def to_columnar(defects: List[Dict], typed: bool = False) -> Dict:
+    """
+    Convert a list of defect records into a compact columnar layout
+
+    Class and street names are interned into string tables, coordinates are
+    quantized to microdegrees, confidences to thousandths, bounding boxes to
+    whole pixels and timestamps to seconds. Image URLs are stored as suffixes
+    of a shared prefix. `defect_classes` is not sent since it can be derived
+    from `detail_class`.
+
+    Args:
+        defects: List of defect dictionaries as returned by fetch_defects
+        typed: Pack numeric columns as little-endian typed array buffers
+
+    Returns:
+        Dictionary of columns, one entry per defect (or per detection for the
+        detail_* columns, sliced by detail_offsets)
+    """
+    classes, class_index = [], {}
+    streets, street_index = [], {}
+
+    ids, lat, lng, heading, street = [], [], [], [], []
+    timestamp, upload_timestamp = [], []
+    original_url, annotated_url = [], []
+    detail_offsets = [0]
+    detail_class, detail_confidence, detail_bbox = [], [], []
+
+    for defect in defects:
+        location = defect.get('location') or {}
+        images = defect.get('images') or {}
+
+        ids.append(defect.get('id', ''))
+        lat.append(round(location.get('latitude', 0) * COORD_SCALE))
+        lng.append(round(location.get('longitude', 0) * COORD_SCALE))
+        heading.append(int(location.get('heading', 0)))
+        street.append(_intern(streets, street_index, location.get('street_name', '')))
+        timestamp.append(_to_seconds(defect.get('timestamp')))
+        upload_timestamp.append(_to_seconds(defect.get('upload_timestamp')))
+        original_url.append(images.get('original_url', ''))
+        annotated_url.append(images.get('annotated_url', ''))
+
+        for detail in defect.get('defect_details', []):
+            box = detail.get('bounding_box', {})
+            detail_class.append(_intern(classes, class_index, detail.get('class', '')))
+            detail_confidence.append(round(detail.get('confidence', 0) * CONFIDENCE_SCALE))
+            detail_bbox.extend(round(box.get(key, 0)) for key in ('x1', 'y1', 'x2', 'y2'))
+        detail_offsets.append(len(detail_class))
+
+    original_prefix = os.path.commonprefix(original_url) if original_url else ''
+    annotated_prefix = os.path.commonprefix(annotated_url) if annotated_url else ''
+
+    pack = _typed if typed else (lambda values, typecode='i': values)
+
+    return {
+        "version": COLUMNAR_VERSION,
+        "count": len(ids),
+        "scale": {"coord": COORD_SCALE, "confidence": CONFIDENCE_SCALE},
+        "classes": classes,
+        "streets": streets,
+        "id": ids,
+        "lat": pack(lat),
+        "lng": pack(lng),
+        "heading": pack(heading),
+        "street": pack(street),
+        "timestamp": pack(timestamp, 'I'),
+        "upload_timestamp": pack(upload_timestamp, 'I'),
+        "original_url_prefix": original_prefix,
+        "original_url": [url[len(original_prefix):] for url in original_url],
+        "annotated_url_prefix": annotated_prefix,
+        "annotated_url": [url[len(annotated_prefix):] for url in annotated_url],
+        "detail_offsets": pack(detail_offsets),
+        "detail_class": pack(detail_class),
+        "detail_confidence": pack(detail_confidence),
+        "detail_bbox": pack(detail_bbox),
+    }
+
+def encode_defects(defects: List[Dict], fmt: str) -> bytes:
+    """
+    Serialize defects in the given format
+    """
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(to_columnar(defects, typed=True), use_bin_type=True)
+    if fmt == FORMAT_COLUMNAR:
+        return json.dumps(to_columnar(defects), separators=(',', ':')).encode('utf-8')
+    return json.dumps(defects).encode('utf-8')
+
+def compress(data: bytes, content_encoding: Optional[str]) -> bytes:
+    """
+    Compress data with the given content encoding ('br', 'gzip' or None)
+    """
+    if content_encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if content_encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return data
+
+class DefectSnapshot:
+    """
+    Latest defect list with its encoded payloads
+
+    Each payload is built at most once per snapshot version and shared by every
+    request and SSE subscriber. The snapshot is reloaded after max_age seconds
+    so writes from other server instances still show up. The loader must
+    raise on failure, the previous snapshot is then kept and the load is
+    retried on the next access.
+    """
+    def __init__(self, loader: Callable[[], List[Dict]], max_age: float = 60):
+        self.loader = loader
+        self.max_age = max_age
+        self.version = 0
+        self.defects = None
+        self.loaded_at = 0.0
+        self.payloads = {}
+        self.lock = threading.RLock()
+
+    def _install(self, defects: List[Dict]) -> int:
+        self.version += 1
+        self.defects = defects
+        self.loaded_at = time.monotonic()
+        self.payloads = {}
+        return self.version
+
+    def _ensure_fresh(self):
+        if self.defects is None or time.monotonic() - self.loaded_at > self.max_age:
+            try:
+                self._install(self.loader())
+            except Exception as e:
+                # Nothing to fall back to on the first load
+                if self.defects is None:
+                    raise
+                print(f"Error reloading defect snapshot, keeping version {self.version}: {str(e)}")
+
+    def refresh(self) -> Optional[int]:
+        """
+        Reload the defect list now
+
+        Returns:
+            The new version, or None if the load failed and the previous
+            snapshot was kept
+        """
+        with self.lock:
+            try:
+                return self._install(self.loader())
+            except Exception as e:
+                print(f"Error refreshing defect snapshot: {str(e)}")
+                return None
+
+    def get(self) -> List[Dict]:
+        """
+        Return the current defect list, reloading it if stale
+        """
+        with self.lock:
+            self._ensure_fresh()
+            return self.defects
+
+    def payload(self, fmt: str, content_encoding: Optional[str] = None) -> bytes:
+        """
+        Return the current defects encoded in fmt and compressed with
+        content_encoding, building and caching it on first use
+        """
+        with self.lock:
+            self._ensure_fresh()
+            key = (fmt, content_encoding)
+            if key not in self.payloads:
+                if content_encoding is None:
+                    self.payloads[key] = encode_defects(self.defects, fmt)
+                else:
+                    raw = self.payload(fmt)
+                    self.payloads[key] = compress(raw, content_encoding)
+            return self.payloads[key]
+
+    def sse_event(self, fmt: str) -> str:
+        """
+        Return the current defects as a ready to send SSE event. Binary
+        formats are base64 encoded since SSE is a text protocol, so columnar
+        is the smallest format here. SSE events are never compressed.
+        """
+        with self.lock:
+            self._ensure_fresh()
+            key = ('sse', fmt)
+            if key not in self.payloads:
+                raw = self.payload(fmt)
+                if fmt == FORMAT_MSGPACK:
+                    data = base64.b64encode(raw).decode('ascii')
+                else:
+                    data = raw.decode('utf-8')
+                self.payloads[key] = f"data: {data}\n\n"
+            return self.payloads[key]
@@ -121,35 +121,59 @@ def process_and_upload(original_images: List[Image.Image],
         print(f"Error committing to Firestore: {str(e)}")
         return {"error": "Failed to upload defects to Firestore"}
 
-def fetch_defects():
+def _fetch_collection(name: str, raise_errors: bool = False) -> List[Dict]:
     """
-    Retrieve all road defects from Firestore.
+    Retrieve all documents of a Firestore collection.
     
+    Args:
+        name: Collection name
+        raise_errors: Raise Firestore errors instead of returning an empty list,
+            for callers that cache the result and must not replace good data
+        
     Returns:
-        List of dictionaries containing defect data
+        List of dictionaries containing document data
     """
     init_firebase()
     try:
         db = get_firestore_client()
         
         # Get all documents from the collection
-        defects_ref = db.collection('road_defects')
-        docs = defects_ref.stream()
+        docs = db.collection(name).stream()
         
         # Convert to list of dictionaries
-        defects = []
+        records = []
         for doc in docs:
             data = doc.to_dict()
             # Convert timestamp to string for JSON serialization
             if 'upload_timestamp' in data:
                 data['upload_timestamp'] = data['upload_timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-            defects.append(data)
+            records.append(data)
             
-        return defects
+        return records
     except Exception as e:
-        print(f"Error retrieving defects: {str(e)}")
+        print(f"Error retrieving {name}: {str(e)}")
+        if raise_errors:
+            raise
         return []
 
+def fetch_defects(raise_errors: bool = False):
+    """
+    Retrieve all road defects from Firestore.
+    
+    Returns:
+        List of dictionaries containing defect data
+    """
+    return _fetch_collection('road_defects', raise_errors)
+
+def fetch_reports(raise_errors: bool = False):
+    """
+    Retrieve all user defect reports from Firestore.
+    
+    Returns:
+        List of dictionaries containing report data
+    """
+    return _fetch_collection('defect_reports', raise_errors)
+
 def process_and_upload_reports(original_image, annotated_image, metadata):
     """
     Process and upload images and metadata to Firebase.
@@ -32,22 +32,33 @@ def get_street_name(lat, lng):
     return "Unknown Street"
 
 
-def get_street_view_image(lat, lng, heading):
+def fetch_street_view_image(lat, lng, heading, pano_id=None):
     """
-    Get the street view image of the given latitude, longitude, and heading
+    Fetch only the street view image of the given latitude, longitude, and heading
+    * pano_id pins the exact panorama instead of the one nearest to the location
     """
 
     params = {
         "size": "640x640",
-        "location": f"{lat},{lng}",
         "heading": heading,
         "fov": 90,
         "pitch": -30,
         "key": API_KEY,
     }
+    if pano_id:
+        params["pano"] = pano_id
+    else:
+        params["location"] = f"{lat},{lng}"
     
     response = requests.get(STREET_VIEW_URL, params=params)
-    image = Image.open(BytesIO(response.content))
+    return Image.open(BytesIO(response.content))
+
+def get_street_view_image(lat, lng, heading):
+    """
+    Get the street view image of the given latitude, longitude, and heading
+    """
+
+    image = fetch_street_view_image(lat, lng, heading)
     street_name = get_street_name(lat, lng)
     
     # Generate result dict
@@ -71,16 +82,17 @@ def get_pano_id(lat, lng):
     data = response.json()
     return data.get("pano_id")
 
-def generate_points_in_radius(center_lat, center_lon, radius_km, num_points):
+def generate_panos_in_radius(center_lat, center_lon, radius_km, num_points, min_radius_km=0):
     """
-    Generate random points within a given radius from a center point
+    Generate random points between min_radius_km and radius_km from a center
+    point, together with the panorama id each one snaps to
     """
     
-    points = []
+    panos = []
     i = 0
     while i < num_points:
         angle = math.radians(random.uniform(0, 360))
-        distance = random.uniform(0, radius_km)
+        distance = random.uniform(min_radius_km, radius_km)
 
         lat_offset = distance / 111.32
         lon_offset = distance / (111.32 * math.cos(math.radians(center_lat)))
@@ -90,10 +102,28 @@ def generate_points_in_radius(center_lat, center_lon, radius_km, num_points):
         
         pano_id = get_pano_id(new_lat, new_lon)
         if pano_id:
-            points.append((new_lat, new_lon))
+            panos.append((new_lat, new_lon, pano_id))
             i += 1
 
-    return points
+    return panos
+
+def generate_points_in_radius(center_lat, center_lon, radius_km, num_points):
+    """
+    Generate random points within a given radius from a center point
+    """
+    
+    panos = generate_panos_in_radius(center_lat, center_lon, radius_km, num_points)
+    return [(lat, lon) for lat, lon, _ in panos]
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Approximate distance in kilometers between two nearby points
+    * uses the same flat earth approximation as generate_points_in_radius
+    """
+    lat_km = (lat2 - lat1) * 111.32
+    lng_km = (lng2 - lng1) * 111.32 * math.cos(math.radians(lat1))
+    return math.hypot(lat_km, lng_km)
 
 
 def capture_images_in_radius(center_lat, center_lon, radius_km, num_images):
@@ -0,0 +1,215 @@
+import math
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Finest zoom level kept in the grid (~40 m cells at the equator)
+MAX_CELL_ZOOM = 20
+
+# Each tile is split into 2^CELL_BITS x 2^CELL_BITS cells
+CELL_BITS = 3
+
+# Deepest tile zoom that can be served, zoom in further and use /defects
+MAX_TILE_ZOOM = MAX_CELL_ZOOM - CELL_BITS
+
+# Web mercator latitude limit
+MAX_LATITUDE = 85.05112878
+
+# Status key for records that do not carry one (street view defects), kept
+# apart from the statuses set on user reports
+DEFAULT_STATUS = "unknown"
+
+def lat_lng_to_tile(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    """
+    Convert a coordinate to web mercator (slippy map) tile indices at a zoom level
+    """
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    lat_rad = math.radians(lat)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def record_position(record: Dict) -> Optional[Tuple[float, float]]:
+    """
+    Get the (lat, lng) of a defect or report record
+
+    Street view defects store a location dict, user reports store free text
+    which is only usable when it is a "lat,lng" pair.
+    """
+    location = record.get("location")
+    if isinstance(location, dict):
+        if "latitude" in location and "longitude" in location:
+            return float(location["latitude"]), float(location["longitude"])
+        return None
+    if isinstance(location, str):
+        parts = location.split(",")
+        if len(parts) == 2:
+            try:
+                lat, lng = float(parts[0]), float(parts[1])
+            except ValueError:
+                return None
+            if -90 <= lat <= 90 and -180 <= lng <= 180:
+                return lat, lng
+    return None
+
+class Cell:
+    """
+    Aggregated defect counts for a single grid cell
+    """
+    __slots__ = ("count", "lat_sum", "lng_sum", "classes", "status")
+
+    def __init__(self):
+        self.count = 0
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+        self.classes = Counter()
+        self.status = Counter()
+
+    def add(self, lat: float, lng: float, classes: List[str], status: str):
+        self.count += 1
+        self.lat_sum += lat
+        self.lng_sum += lng
+        self.classes.update(set(classes))
+        self.status[status] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "lat": self.lat_sum / self.count,
+            "lng": self.lng_sum / self.count,
+            "classes": dict(self.classes),
+            "status": dict(self.status),
+        }
+
+class TileGrid:
+    """
+    Multi-resolution grid of defect counts
+
+    Every record is added to one cell per zoom level from 0 to MAX_CELL_ZOOM,
+    so serving a tile only looks up its own cells and costs the same no
+    matter how many defects exist. The grid is loaded with a full scan on
+    first use and kept up to date with add_records as new records are
+    written. After max_age seconds it is rebuilt in a background thread and
+    swapped in, so tile requests never wait on a reload. The loader must
+    raise on failure rather than return a partial list, so a failed reload
+    leaves the current grid in place.
+    """
+    def __init__(self, loader: Callable[[], List[Dict]], max_age: float = 600):
+        self.loader = loader
+        self.max_age = max_age
+        self.cells = None
+        self.ids = set()
+        self.loaded_at = 0.0
+        self.reloading = False
+        # Records added while a background reload is running
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def _add(self, cells: Dict, ids: set, record: Dict):
+        record_id = record.get("id")
+        if record_id is not None:
+            # Already counted, e.g. picked up by a load right after being written
+            if record_id in ids:
+                return
+            ids.add(record_id)
+
+        position = record_position(record)
+        if position is None:
+            return
+        lat, lng = position
+        classes = record.get("defect_classes", [])
+        status = record.get("status", DEFAULT_STATUS)
+
+        x, y = lat_lng_to_tile(lat, lng, MAX_CELL_ZOOM)
+        for zoom in range(MAX_CELL_ZOOM, -1, -1):
+            key = (zoom, x, y)
+            if key not in cells:
+                cells[key] = Cell()
+            cells[key].add(lat, lng, classes, status)
+            x >>= 1
+            y >>= 1
+
+    def _build(self) -> Tuple[Dict, set]:
+        cells, ids = {}, set()
+        for record in self.loader():
+            self._add(cells, ids, record)
+        return cells, ids
+
+    def _reload(self):
+        """
+        Rebuild the grid outside the lock and swap it in
+        """
+        try:
+            cells, ids = self._build()
+        except Exception as e:
+            # Keep serving the current grid, the next check retries
+            print(f"Error reloading tile grid: {str(e)}")
+            with self.lock:
+                self.reloading = False
+                self.pending = []
+            return
+
+        with self.lock:
+            # Replay records written during the reload, duplicates are skipped
+            for record in self.pending:
+                self._add(cells, ids, record)
+            self.cells, self.ids = cells, ids
+            self.pending = []
+            self.reloading = False
+            self.loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self.cells is None:
+            # Nothing to serve yet, load synchronously
+            self.cells, self.ids = self._build()
+            self.loaded_at = time.monotonic()
+        elif not self.reloading and time.monotonic() - self.loaded_at > self.max_age:
+            self.reloading = True
+            threading.Thread(target=self._reload, daemon=True).start()
+
+    def add_records(self, records: List[Dict]):
+        """
+        Add newly written records to the grid
+        """
+        with self.lock:
+            # Not loaded yet, the first load will pick these records up
+            if self.cells is None:
+                return
+            for record in records:
+                self._add(self.cells, self.ids, record)
+            if self.reloading:
+                self.pending.extend(records)
+
+    def tile(self, z: int, x: int, y: int) -> Dict:
+        """
+        Get the aggregated cells of a tile
+
+        Args:
+            z: Tile zoom level, at most MAX_TILE_ZOOM
+            x: Tile column
+            y: Tile row
+
+        Returns:
+            Dictionary with the tile totals and its non-empty cells at zoom
+            z + CELL_BITS. Empty tiles have the same keys with a zero count.
+        """
+        with self.lock:
+            self._ensure_fresh()
+            cell_zoom = z + CELL_BITS
+            result = {"z": z, "x": x, "y": y, "cell_zoom": cell_zoom, "cells": []}
+
+            total = self.cells.get((z, x, y))
+            if total is None:
+                result.update({"count": 0, "lat": None, "lng": None, "classes": {}, "status": {}})
+                return result
+            result.update(total.to_dict())
+
+            size = 1 << CELL_BITS
+            for cx in range(x * size, (x + 1) * size):
+                for cy in range(y * size, (y + 1) * size):
+                    cell = self.cells.get((cell_zoom, cx, cy))
+                    if cell is not None:
+                        result["cells"].append({"x": cx, "y": cy, **cell.to_dict()})
+            return result